@@ -1,50 +1,74 @@
 import streamlit as st
+import copy
+import functools
 import json
+import re
 from datetime import date, time, datetime
 import os
-from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
-from typing import Optional, Literal
+from pydantic import AfterValidator, BaseModel, Field, TypeAdapter, ValidationError, field_validator, model_validator
+from typing import Annotated, Optional, Literal
+
+# --- Current date, cached per script run ---
+# Refreshed once at the top of app(); every validator and handler below reads
+# the cached value instead of constructing a fresh date per call.
+def _today() -> date:
+    t = st.session_state.get("_today_cached")
+    if t is None:
+        t = st.session_state._today_cached = date.today()
+    return t
+
+# --- Shared age computation ---
+# Memoized so re-validating the same date of birth doesn't redo the
+# year/month/day arithmetic; keyed on (dob, today) so results roll over at
+# midnight.
+@functools.lru_cache(maxsize=128)
+def _age(dob: date, today: date) -> int:
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+MIN_AGE_FOR_CONSENT = 18
+
+@functools.lru_cache(maxsize=128)
+def _is_minor(dob: date, today: date) -> bool:
+    return _age(dob, today) < MIN_AGE_FOR_CONSENT
+
+# --- Shared field types ---
+# One compiled constraint set serves every phone/date field instead of each
+# model recompiling an identical rule into its own core schema.
+def _not_future(v: date) -> date:
+    if v > _today():
+        raise ValueError('Date cannot be in the future.')
+    return v
+
+def _at_least_18(v: date) -> date:
+    if _is_minor(v, _today()):
+        raise ValueError(f'Patient must be at least {MIN_AGE_FOR_CONSENT} years old to proceed with this form directly. Parental/Guardian consent may be required.')
+    return v
+
+PhoneNumber = Annotated[str, Field(min_length=10, max_length=10, pattern=r"^\d{10}$")]
+PastDate = Annotated[date, AfterValidator(_not_future)]
+AdultDate = Annotated[date, AfterValidator(_not_future), AfterValidator(_at_least_18)]
 
 # --- Pydantic Models for Form Validation (remain unchanged) ---
 
 class PatientDemographics(BaseModel):
     full_legal_name: str = Field(..., min_length=2, max_length=100, description="Patient's full legal name")
-    date_of_birth: date = Field(..., description="Patient's date of birth")
+    date_of_birth: AdultDate = Field(..., description="Patient's date of birth")
     gender: Literal["Male", "Female", "Non-binary", "Prefer not to say"] = Field(..., description="Patient's gender, e.g., Male, Female, Non-binary")
     address: str = Field("", description="Patient's current address")
-    phone_number: str = Field(..., min_length=10, max_length=10, pattern=r"^\d{10}$", description="Patient's 10-digit phone number")
+    phone_number: PhoneNumber = Field(..., description="Patient's 10-digit phone number")
     email_address: str = Field(..., pattern=r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$", description="Patient's email address")
     preferred_language: str = Field("English", description="Patient's preferred language")
 
-    @field_validator('date_of_birth')
-    @classmethod
-    def validate_date_of_birth(cls, v: date):
-        if v > date.today():
-            raise ValueError('Date of birth cannot be in the future.')
-        today = date.today()
-        age = today.year - v.year - ((today.month, today.day) < (v.month, v.day))
-        MIN_AGE_FOR_CONSENT = 18
-        if age < MIN_AGE_FOR_CONSENT:
-            raise ValueError(f'Patient must be at least {MIN_AGE_FOR_CONSENT} years old to proceed with this form directly. Parental/Guardian consent may be required.')
-        return v
-
 class EmergencyContact(BaseModel):
     name: Optional[str] = Field(None, description="Emergency contact's name")
     relationship: Optional[str] = Field(None, description="Emergency contact's relationship to patient")
-    phone: Optional[str] = Field(None, min_length=10, max_length=10, pattern=r"^\d{10}$", description="Emergency contact's 10-digit phone number")
+    phone: Optional[PhoneNumber] = Field(None, description="Emergency contact's 10-digit phone number")
 
 class PrimaryInsurance(BaseModel):
     provider_name: str = Field(..., min_length=2, description="Primary insurance provider name")
     policy_number: str = Field(..., min_length=5, description="Primary insurance policy number")
     group_number: Optional[str] = Field(None, description="Primary insurance group number")
-    subscriber_dob: Optional[date] = Field(None, description="Primary insurance subscriber date of birth")
-
-    @field_validator('subscriber_dob')
-    @classmethod
-    def validate_subscriber_dob(cls, v: Optional[date]):
-        if v and v > date.today():
-            raise ValueError('Subscriber date of birth cannot be in the future.')
-        return v
+    subscriber_dob: Optional[PastDate] = Field(None, description="Primary insurance subscriber date of birth")
 
 class SecondaryInsurance(BaseModel):
     has_secondary_insurance: bool
@@ -94,7 +118,7 @@ class AppointmentDetails(BaseModel):
     @field_validator('desired_appointment_date')
     @classmethod
     def validate_desired_appointment_date(cls, v: date):
-        if v < date.today():
+        if v < _today():
             raise ValueError('Desired appointment date cannot be in the past.')
         return v
 
@@ -110,9 +134,82 @@ class PatientPreAppointmentInfo(BaseModel):
     appointment_details: AppointmentDetails
     legal_compliance: LegalCompliance
 
+# --- Empty skeleton for the collected patient info ---
+# Deep-copied into session state once per session so every handler can index
+# sections directly instead of rebuilding them with setdefault/.get chains.
+_EMPTY_SKELETON = {
+    "patient_demographics": {},
+    "emergency_contact": {},
+    "insurance_and_financial": {"primary_insurance": {}, "secondary_insurance": {}},
+    "medical_history_overview": {},
+    "appointment_details": {},
+    "legal_compliance": {},
+}
+
+# --- Precompiled patterns for cheap per-field checks on the chat hot path ---
+# These mirror the Field constraints on PatientDemographics; running the
+# compiled regex directly avoids a full Pydantic model validation per message.
+_PHONE_RE = re.compile(r"^\d{10}$")
+
+def _valid_phone(s: str) -> bool:
+    return _PHONE_RE.match(s) is not None
+# Gender options mirror the Literal on PatientDemographics.gender; the
+# frozenset gives the handler an O(1) membership test per message.
+_GENDER_OPTIONS = ("Male", "Female", "Non-binary", "Prefer not to say")
+_GENDER_SET = frozenset(_GENDER_OPTIONS)
+_EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+
+# --- Cached validators, compiled on first use ---
+# The per-field handlers re-validate a single field by running a whole model;
+# building a core schema per message is wasted work, so the compiled
+# TypeAdapters live in one lazily built, cached dict. Deferring construction
+# to the first validation also keeps schema compilation off the import path.
+# cache_resource shares the compiled set across sessions and reruns the same
+# way the loaded NPP text is shared, without pickling the adapters.
+# The single-field date adapters exist because the DOB handlers only need the
+# date rules, not a whole section model padded with defaults.
+@st.cache_resource(show_spinner=False)
+def _adapters() -> dict:
+    return {
+        "primary_insurance": TypeAdapter(PrimaryInsurance),
+        "full": TypeAdapter(PatientPreAppointmentInfo),
+        "adult_date": TypeAdapter(AdultDate),
+        "past_date": TypeAdapter(PastDate),
+    }
+
+# --- Default values used to backfill required fields at final submission ---
+# Kept in one place so the fallbacks stay consistent with the Pydantic models above.
+_DEFAULTS = {
+    "patient_demographics": {
+        "full_legal_name": "Temp Name",
+        "date_of_birth": "2000-01-01",
+        "gender": "Male",
+        "phone_number": "1234567890",
+        "email_address": "temp@example.com",
+    },
+    "primary_insurance": {
+        "provider_name": "Temp Provider",
+        "policy_number": "TEMP12345",
+    },
+    "secondary_insurance": {
+        "has_secondary_insurance": False,
+    },
+    "insurance_and_financial": {
+        "reason_for_visit_brief": "Temp Reason",
+        "financial_responsibility_acknowledged": False,
+    },
+    "medical_history_overview": {
+        "opt_in": False,
+    },
+    "legal_compliance": {
+        "consent_for_treatment_acknowledged": False,
+        "hipaa_privacy_acknowledged": False,
+    },
+}
+
 # --- Helper function to load NPP content ---
-def load_npp_content():
-    npp_file_path = "NPP.md" # Adjust path if NPP.md is not in the same directory
+@st.cache_data(show_spinner=False)
+def load_npp_content(npp_file_path="NPP.md"): # Adjust path if NPP.md is not in the same directory
     if os.path.exists(npp_file_path):
         try:
             with open(npp_file_path, "r", encoding="utf-8") as f:
@@ -124,728 +221,630 @@ def load_npp_content():
         st.error(f"Error: NPP document '{npp_file_path}' not found.")
         return "Placeholder NPP content: This is a placeholder for the Notice of Privacy Practices. Please ensure the 'NPP.md' file is in the correct directory."
 
+# The NPP document is large and immutable for the life of the process, so the
+# chat messages that embed it are composed once per content value rather than
+# re-concatenated on every render.
+@st.cache_data(show_spinner=False)
+def _npp_review_message(npp_content: str) -> str:
+    return ("Please review our Notice of Privacy Practices. You must agree to proceed with your pre-appointment registration.\n\n"
+            + npp_content
+            + "\n\nDo you agree to the Notice of Privacy Practices? (Yes/No)")
+
+@st.cache_data(show_spinner=False)
+def _npp_answer_message(npp_content: str) -> str:
+    return ("The Notice of Privacy Practices (NPP) describes how your medical information may be used and disclosed and your rights regarding that information. It outlines our commitment to protecting your health information. You can read the full text again here:\n\n"
+            + npp_content)
+
+# --- Conversation prompt table ---
+# Maps a conversation state to (message, next_state). A next_state of None
+# marks a reprompt: the assistant nudges the user and the conversation stays
+# put. Messages that depend on session state are callables evaluated at ask
+# time; a callable may also return a list of messages to append in order.
+def _emergency_contact_display_name():
+    return st.session_state.new_patient_info['emergency_contact'].get('name') or 'your emergency contact'
+
+_PROMPTS = {
+    "initial_greeting": ("Welcome! Are you a new or existing patient?", "user_type_selection"),
+    "user_type_selection": ("Please type 'New User' or 'Existing User'.", None),
+    "display_npp": (lambda: _npp_review_message(st.session_state.npp_content), "npp_agreement"),
+    "npp_agreement": ("Please type 'Yes' to agree, or 'No' to go back to the user type selection.", None),
+    "ask_full_legal_name": ("Let's start with your demographics. What is your full legal name?", "get_full_legal_name"),
+    "get_full_legal_name": ("Please provide your full legal name.", None),
+    "ask_date_of_birth": ("What is your date of birth? (YYYY-MM-DD)", "get_date_of_birth"),
+    "get_date_of_birth": ("Please provide your date of birth in YYYY-MM-DD format.", None),
+    "ask_phone_number": ("What is your 10-digit phone number? (e.g., 5551234567)", "get_phone_number"),
+    "get_phone_number": ("Please enter your 10-digit phone number (numbers only).", None),
+    "ask_email_address": ("What is your email address?", "get_email_address"),
+    "get_email_address": ("Please enter a valid email address.", None),
+    "ask_gender": ("What is your gender? (Male, Female, Non-binary, Prefer not to say)", "get_gender"),
+    "get_gender": ("Please select your gender from the options: Male, Female, Non-binary, or Prefer not to say.", None),
+    "ask_address": ("What is your current address?", "get_address"),
+    "get_address": ("Please provide your full current address.", None),
+    "ask_preferred_language": ("What is your preferred language? (e.g., English)", "get_preferred_language"),
+    "get_preferred_language": ("Please provide your preferred language.", None),
+    "ask_emergency_contact_name": ("Now let's move to emergency contact details. What is your emergency contact's full name? (Type 'Skip' if you don't have one)", "get_emergency_contact_name"),
+    "get_emergency_contact_name": ("Please provide your emergency contact's name or type 'Skip'.", None),
+    "ask_emergency_contact_relationship": (lambda: f"What is {_emergency_contact_display_name()}'s relationship to you? (e.g., Friend, Parent, Spouse)", "get_emergency_contact_relationship"),
+    "ask_emergency_contact_phone": (lambda: f"What is {_emergency_contact_display_name()}'s 10-digit phone number?", "get_emergency_contact_phone"),
+    "get_emergency_contact_phone": ("Please enter your emergency contact's 10-digit phone number (numbers only).", None),
+    "ask_primary_insurance_provider": ("Next, let's gather your insurance information. What is the name of your primary insurance provider?", "get_primary_insurance_provider"),
+    "get_primary_insurance_provider": ("Please provide the name of your primary insurance provider.", None),
+    "ask_primary_insurance_policy_number": ("What is your primary insurance policy number?", "get_primary_insurance_policy_number"),
+    "get_primary_insurance_policy_number": ("Please provide your primary insurance policy number.", None),
+    "ask_primary_insurance_group_number": ("Do you have a group number for your primary insurance? If not, type 'None'.", "get_primary_insurance_group_number"),
+    "ask_primary_insurance_subscriber_name": ("Is the subscriber name on your primary insurance policy different from your name? If so, what is it? If not, type 'Same'.", "get_primary_insurance_subscriber_name"),
+    "ask_primary_insurance_subscriber_dob": ("What is the subscriber's date of birth for your primary insurance? (YYYY-MM-DD, or type 'Skip' if not applicable)", "get_primary_insurance_subscriber_dob"),
+    "get_primary_insurance_subscriber_dob": ("Please provide the subscriber's date of birth in YYYY-MM-DD format or type 'Skip'.", None),
+    "ask_secondary_insurance_yn": ("Do you have secondary insurance? (Yes/No)", "get_secondary_insurance_yn"),
+    "get_secondary_insurance_yn": ("Please answer 'Yes' or 'No'.", None),
+    "ask_secondary_insurance_provider": ("What is the name of your secondary insurance provider?", "get_secondary_insurance_provider"),
+    "get_secondary_insurance_provider": ("Please provide the name of your secondary insurance provider.", None),
+    "ask_secondary_insurance_policy_number": ("What is your secondary insurance policy number?", "get_secondary_insurance_policy_number"),
+    "get_secondary_insurance_policy_number": ("Please provide your secondary insurance policy number.", None),
+    "ask_reason_for_visit_brief": ("What is the brief reason for your visit? (e.g., 'Routine check-up', 'Follow-up for blood pressure')", "get_reason_for_visit_brief"),
+    "get_reason_for_visit_brief": ("Please provide a brief reason for your visit.", None),
+    "ask_financial_responsibility": ("Do you understand your financial responsibility (co-pays, deductibles, etc.)? (Yes/No)", "get_financial_responsibility"),
+    "get_financial_responsibility": ("Please answer 'Yes' or 'No' regarding your understanding of financial responsibility.", None),
+    "ask_medical_history_opt_in": ("Would you like to provide an initial overview of your medical history now? (Yes/No)", "get_medical_history_opt_in"),
+    "get_medical_history_opt_in": ("Please answer 'Yes' or 'No'.", None),
+    "ask_reason_for_appointment_full": ("Can you describe the Reason for your Appointment/Chief Complaint in more detail? (Type 'Skip' if you already mentioned it briefly)", "get_reason_for_appointment_full"),
+    "ask_known_allergies": ("Do you have any Known Allergies (e.g., medications, food, environmental)? (Type 'None' if no allergies)", "get_known_allergies"),
+    "ask_current_medications": ("Please list your Current Medications (including OTC and supplements) and Dosages (e.g., 'Amlodipine 5mg daily'). (Type 'None' if no medications)", "get_current_medications"),
+    "ask_major_past_medical_conditions": ("Do you have any Major Past Medical Conditions/Diagnoses (e.g., 'Diabetes, Hypertension, Asthma')? (Type 'None' if none)", "get_major_past_medical_conditions"),
+    "ask_referring_physician": ("Is there a Referring Physician (name, if any)? (Type 'None' if none)", "get_referring_physician"),
+    "ask_desired_appointment_date": ("Now for appointment details. What is your desired appointment date? (YYYY-MM-DD)", "get_desired_appointment_date"),
+    "get_desired_appointment_date": ("Please provide your desired appointment date in YYYY-MM-DD format. Remember, it cannot be in the past.", None),
+    "ask_desired_appointment_time": ("What is your desired appointment time? (HH:MM AM/PM, e.g., 10:30 AM)", "get_desired_appointment_time"),
+    "get_desired_appointment_time": ("Please provide your desired appointment time in HH:MM AM/PM format.", None),
+    "ask_preferred_provider": ("Do you have a preferred provider? (e.g., Dr. Smith, or type 'None')", "get_preferred_provider"),
+    "ask_special_needs": ("Do you have any special needs (e.g., interpreter, wheelchair access)? (Type 'None' if none)", "get_special_needs"),
+    "ask_consent_for_treatment": ("Do you acknowledge initial consent for treatment (full consent upon arrival)? (Yes/No)", "get_consent_for_treatment"),
+    "get_consent_for_treatment": ("Please answer 'Yes' or 'No'.", None),
+    "ask_hipaa_privacy_acknowledged": ("Do you acknowledge receipt and understanding of HIPAA Privacy Practices? (Yes/No)", "get_hipaa_privacy_acknowledged"),
+    "get_hipaa_privacy_acknowledged": ("Please answer 'Yes' or 'No'.", None),
+    "review_and_submit": (lambda: ["We have collected all necessary information. Please review the summary and type 'Submit' to finalize, or 'Back' to make changes.", json.dumps(st.session_state.new_patient_info, indent=2)], "await_final_submission"),
+    "await_final_submission": ("Type 'Submit' to finalize or 'Back' to review.", None),
+    "submission_complete": ("Your pre-appointment registration is complete! Thank you. Would you like to 'Start Over'?", "offer_start_over"),
+    "existing_user_info": ("Thank you for being an existing patient! For existing patients, please contact our support team at 123-456-7890 or log in to your patient portal for appointment management. Type 'Start Over' to go back to user selection.", "offer_start_over"),
+}
+
 # --- Helper function to manage conversation state and ask next question ---
 def ask_next_question():
-    current_state = st.session_state.conversation_state
-    new_patient_info = st.session_state.new_patient_info
-
-    if current_state == "initial_greeting":
-        st.session_state.messages.append({"role": "assistant", "content": "Welcome! Are you a new or existing patient?"})
-        st.session_state.conversation_state = "user_type_selection"
-    
-    elif current_state == "user_type_selection":
-        st.session_state.messages.append({"role": "assistant", "content": "Please type 'New User' or 'Existing User'."})
-    
-    elif current_state == "display_npp":
-        st.session_state.messages.append({"role": "assistant", "content": "Please review our Notice of Privacy Practices. You must agree to proceed with your pre-appointment registration.\n\n" + st.session_state.npp_content + "\n\nDo you agree to the Notice of Privacy Practices? (Yes/No)"})
-        st.session_state.conversation_state = "npp_agreement"
-
-    elif current_state == "npp_agreement":
-        st.session_state.messages.append({"role": "assistant", "content": "Please type 'Yes' to agree, or 'No' to go back to the user type selection."})
-
-    elif current_state == "ask_full_legal_name":
-        st.session_state.messages.append({"role": "assistant", "content": "Let's start with your demographics. What is your full legal name?"})
-        st.session_state.conversation_state = "get_full_legal_name"
-    
-    elif current_state == "get_full_legal_name":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your full legal name."})
-
-    elif current_state == "ask_date_of_birth":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your date of birth? (YYYY-MM-DD)"})
-        st.session_state.conversation_state = "get_date_of_birth"
-    
-    elif current_state == "get_date_of_birth":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your date of birth in YYYY-MM-DD format."})
-
-    elif current_state == "ask_phone_number":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your 10-digit phone number? (e.g., 5551234567)"})
-        st.session_state.conversation_state = "get_phone_number"
-    
-    elif current_state == "get_phone_number":
-        st.session_state.messages.append({"role": "assistant", "content": "Please enter your 10-digit phone number (numbers only)."})
-
-    elif current_state == "ask_email_address":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your email address?"})
-        st.session_state.conversation_state = "get_email_address"
-    
-    elif current_state == "get_email_address":
-        st.session_state.messages.append({"role": "assistant", "content": "Please enter a valid email address."})
-
-    elif current_state == "ask_gender":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your gender? (Male, Female, Non-binary, Prefer not to say)"})
-        st.session_state.conversation_state = "get_gender"
-    
-    elif current_state == "get_gender":
-        st.session_state.messages.append({"role": "assistant", "content": "Please select your gender from the options: Male, Female, Non-binary, or Prefer not to say."})
-
-    elif current_state == "ask_address":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your current address?"})
-        st.session_state.conversation_state = "get_address"
-    
-    elif current_state == "get_address":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your full current address."})
-
-    elif current_state == "ask_preferred_language":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your preferred language? (e.g., English)"})
-        st.session_state.conversation_state = "get_preferred_language"
-    
-    elif current_state == "get_preferred_language":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your preferred language."})
-
-    elif current_state == "ask_emergency_contact_name":
-        st.session_state.messages.append({"role": "assistant", "content": "Now let's move to emergency contact details. What is your emergency contact's full name? (Type 'Skip' if you don't have one)"})
-        st.session_state.conversation_state = "get_emergency_contact_name"
-    
-    elif current_state == "get_emergency_contact_name":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your emergency contact's name or type 'Skip'."})
-    
-    elif current_state == "ask_emergency_contact_relationship":
-        st.session_state.messages.append({"role": "assistant", "content": f"What is {new_patient_info.get('emergency_contact', {}).get('name', 'your emergency contact')}'s relationship to you? (e.g., Friend, Parent, Spouse)"})
-        st.session_state.conversation_state = "get_emergency_contact_relationship"
-    
-    elif current_state == "ask_emergency_contact_phone":
-        st.session_state.messages.append({"role": "assistant", "content": f"What is {new_patient_info.get('emergency_contact', {}).get('name', 'your emergency contact')}'s 10-digit phone number?"})
-        st.session_state.conversation_state = "get_emergency_contact_phone"
-    
-    elif current_state == "get_emergency_contact_phone":
-        st.session_state.messages.append({"role": "assistant", "content": "Please enter your emergency contact's 10-digit phone number (numbers only)."})
-
-    elif current_state == "ask_primary_insurance_provider":
-        st.session_state.messages.append({"role": "assistant", "content": "Next, let's gather your insurance information. What is the name of your primary insurance provider?"})
-        st.session_state.conversation_state = "get_primary_insurance_provider"
-    
-    elif current_state == "get_primary_insurance_provider":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide the name of your primary insurance provider."})
-
-    elif current_state == "ask_primary_insurance_policy_number":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your primary insurance policy number?"})
-        st.session_state.conversation_state = "get_primary_insurance_policy_number"
-    
-    elif current_state == "get_primary_insurance_policy_number":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your primary insurance policy number."})
-
-    elif current_state == "ask_primary_insurance_group_number":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you have a group number for your primary insurance? If not, type 'None'."})
-        st.session_state.conversation_state = "get_primary_insurance_group_number"
-    
-    elif current_state == "ask_primary_insurance_subscriber_name":
-        st.session_state.messages.append({"role": "assistant", "content": "Is the subscriber name on your primary insurance policy different from your name? If so, what is it? If not, type 'Same'."})
-        st.session_state.conversation_state = "get_primary_insurance_subscriber_name"
-
-    elif current_state == "ask_primary_insurance_subscriber_dob":
-        st.session_state.messages.append({"role": "assistant", "content": "What is the subscriber's date of birth for your primary insurance? (YYYY-MM-DD, or type 'Skip' if not applicable)"})
-        st.session_state.conversation_state = "get_primary_insurance_subscriber_dob"
-    
-    elif current_state == "get_primary_insurance_subscriber_dob":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide the subscriber's date of birth in YYYY-MM-DD format or type 'Skip'."})
-
-    elif current_state == "ask_secondary_insurance_yn":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you have secondary insurance? (Yes/No)"})
-        st.session_state.conversation_state = "get_secondary_insurance_yn"
-    
-    elif current_state == "get_secondary_insurance_yn":
-        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
-
-    elif current_state == "ask_secondary_insurance_provider":
-        st.session_state.messages.append({"role": "assistant", "content": "What is the name of your secondary insurance provider?"})
-        st.session_state.conversation_state = "get_secondary_insurance_provider"
-    
-    elif current_state == "get_secondary_insurance_provider":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide the name of your secondary insurance provider."})
-
-    elif current_state == "ask_secondary_insurance_policy_number":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your secondary insurance policy number?"})
-        st.session_state.conversation_state = "get_secondary_insurance_policy_number"
-    
-    elif current_state == "get_secondary_insurance_policy_number":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your secondary insurance policy number."})
-
-    elif current_state == "ask_reason_for_visit_brief":
-        st.session_state.messages.append({"role": "assistant", "content": "What is the brief reason for your visit? (e.g., 'Routine check-up', 'Follow-up for blood pressure')"})
-        st.session_state.conversation_state = "get_reason_for_visit_brief"
-    
-    elif current_state == "get_reason_for_visit_brief":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide a brief reason for your visit."})
-
-    elif current_state == "ask_financial_responsibility":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you understand your financial responsibility (co-pays, deductibles, etc.)? (Yes/No)"})
-        st.session_state.conversation_state = "get_financial_responsibility"
-    
-    elif current_state == "get_financial_responsibility":
-        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No' regarding your understanding of financial responsibility."})
-
-    elif current_state == "ask_medical_history_opt_in":
-        st.session_state.messages.append({"role": "assistant", "content": "Would you like to provide an initial overview of your medical history now? (Yes/No)"})
-        st.session_state.conversation_state = "get_medical_history_opt_in"
-    
-    elif current_state == "get_medical_history_opt_in":
-        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
-    
-    elif current_state == "ask_reason_for_appointment_full":
-        st.session_state.messages.append({"role": "assistant", "content": "Can you describe the Reason for your Appointment/Chief Complaint in more detail? (Type 'Skip' if you already mentioned it briefly)"})
-        st.session_state.conversation_state = "get_reason_for_appointment_full"
-    
-    elif current_state == "ask_known_allergies":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you have any Known Allergies (e.g., medications, food, environmental)? (Type 'None' if no allergies)"})
-        st.session_state.conversation_state = "get_known_allergies"
-    
-    elif current_state == "ask_current_medications":
-        st.session_state.messages.append({"role": "assistant", "content": "Please list your Current Medications (including OTC and supplements) and Dosages (e.g., 'Amlodipine 5mg daily'). (Type 'None' if no medications)"})
-        st.session_state.conversation_state = "get_current_medications"
-
-    elif current_state == "ask_major_past_medical_conditions":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you have any Major Past Medical Conditions/Diagnoses (e.g., 'Diabetes, Hypertension, Asthma')? (Type 'None' if none)"})
-        st.session_state.conversation_state = "get_major_past_medical_conditions"
-
-    elif current_state == "ask_referring_physician":
-        st.session_state.messages.append({"role": "assistant", "content": "Is there a Referring Physician (name, if any)? (Type 'None' if none)"})
-        st.session_state.conversation_state = "get_referring_physician"
-
-    elif current_state == "ask_desired_appointment_date":
-        st.session_state.messages.append({"role": "assistant", "content": "Now for appointment details. What is your desired appointment date? (YYYY-MM-DD)"})
-        st.session_state.conversation_state = "get_desired_appointment_date"
-    
-    elif current_state == "get_desired_appointment_date":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your desired appointment date in YYYY-MM-DD format. Remember, it cannot be in the past."})
-
-    elif current_state == "ask_desired_appointment_time":
-        st.session_state.messages.append({"role": "assistant", "content": "What is your desired appointment time? (HH:MM AM/PM, e.g., 10:30 AM)"})
-        st.session_state.conversation_state = "get_desired_appointment_time"
-    
-    elif current_state == "get_desired_appointment_time":
-        st.session_state.messages.append({"role": "assistant", "content": "Please provide your desired appointment time in HH:MM AM/PM format."})
-
-    elif current_state == "ask_preferred_provider":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you have a preferred provider? (e.g., Dr. Smith, or type 'None')"})
-        st.session_state.conversation_state = "get_preferred_provider"
-    
-    elif current_state == "ask_special_needs":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you have any special needs (e.g., interpreter, wheelchair access)? (Type 'None' if none)"})
-        st.session_state.conversation_state = "get_special_needs"
-
-    elif current_state == "ask_consent_for_treatment":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you acknowledge initial consent for treatment (full consent upon arrival)? (Yes/No)"})
-        st.session_state.conversation_state = "get_consent_for_treatment"
-    
-    elif current_state == "get_consent_for_treatment":
-        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
+    prompt = _PROMPTS.get(st.session_state.conversation_state)
+    if prompt is None:
+        return
+    content, next_state = prompt
+    if callable(content):
+        content = content()
+    if isinstance(content, list):
+        for item in content:
+            st.session_state.messages.append({"role": "assistant", "content": item})
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": content})
+    if next_state is not None:
+        st.session_state.conversation_state = next_state
+
+# --- Per-state input handlers ---
+# Each handler covers one conversation state; process_response dispatches to
+# the active one through _HANDLERS so only that handler's bytecode runs per
+# message instead of walking one long if/elif chain.
+
+def _handle_user_type_selection(user_input: str):
+    if "new user" in user_input.lower():
+        st.session_state.user_type_chosen = "New User"
+        st.session_state.conversation_state = "display_npp"
+        ask_next_question()
+    elif "existing user" in user_input.lower():
+        st.session_state.user_type_chosen = "Existing User"
+        st.session_state.conversation_state = "existing_user_info"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "I didn't understand. Please type 'New User' or 'Existing User'."})
 
-    elif current_state == "ask_hipaa_privacy_acknowledged":
-        st.session_state.messages.append({"role": "assistant", "content": "Do you acknowledge receipt and understanding of HIPAA Privacy Practices? (Yes/No)"})
-        st.session_state.conversation_state = "get_hipaa_privacy_acknowledged"
-    
-    elif current_state == "get_hipaa_privacy_acknowledged":
-        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
+def _handle_npp_agreement(user_input: str):
+    if "yes" in user_input.lower():
+        st.session_state.npp_agreed = True
+        st.session_state.conversation_state = "ask_full_legal_name"
+        st.session_state.messages.append({"role": "assistant", "content": "Great! Let's start with your pre-appointment registration."})
+        ask_next_question()
+    elif "no" in user_input.lower():
+        st.session_state.npp_agreed = False
+        st.session_state.user_type_chosen = None # Go back to initial selection
+        st.session_state.conversation_state = "initial_greeting"
+        st.session_state.messages.append({"role": "assistant", "content": "Okay, returning to the start."})
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please respond with 'Yes' or 'No'."})
 
-    elif current_state == "review_and_submit":
-        st.session_state.messages.append({"role": "assistant", "content": "We have collected all necessary information. Please review the summary and type 'Submit' to finalize, or 'Back' to make changes."})
-        st.session_state.messages.append({"role": "assistant", "content": json.dumps(st.session_state.new_patient_info, indent=2)})
-        st.session_state.conversation_state = "await_final_submission"
-    
-    elif current_state == "await_final_submission":
-        st.session_state.messages.append({"role": "assistant", "content": "Type 'Submit' to finalize or 'Back' to review."})
+# Demographics
+def _handle_get_full_legal_name(user_input: str):
+    if 2 <= len(user_input) <= 100:
+        st.session_state.new_patient_info["patient_demographics"]["full_legal_name"] = user_input
+        st.session_state.conversation_state = "ask_date_of_birth"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please enter a valid full legal name (2-100 characters)."})
+
+def _handle_get_date_of_birth(user_input: str):
+    try:
+        dob = date.fromisoformat(user_input)
+        _adapters()["adult_date"].validate_python(dob)
+        # Only write when the value actually changed (e.g. re-entered after 'Back')
+        demographics = st.session_state.new_patient_info["patient_demographics"]
+        new_dob = dob.isoformat()
+        if demographics.get("date_of_birth") != new_dob:
+            demographics["date_of_birth"] = new_dob
+        st.session_state.conversation_state = "ask_phone_number"
+        ask_next_question()
+    except ValueError as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Invalid date format or age. {e}. Please use YYYY-MM-DD."})
+    except ValidationError as e:
+        # More specific error message from Pydantic validator
+        st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please use YYYY-MM-DD."})
+
+def _handle_get_phone_number(user_input: str):
+    if _valid_phone(user_input):
+        st.session_state.new_patient_info["patient_demographics"]["phone_number"] = user_input
+        st.session_state.conversation_state = "ask_email_address"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please enter a valid 10-digit phone number (numbers only)."})
 
-    elif current_state == "submission_complete":
-        st.session_state.messages.append({"role": "assistant", "content": "Your pre-appointment registration is complete! Thank you. Would you like to 'Start Over'?"})
-        st.session_state.conversation_state = "offer_start_over"
+def _handle_get_email_address(user_input: str):
+    if _EMAIL_RE.match(user_input):
+        st.session_state.new_patient_info["patient_demographics"]["email_address"] = user_input
+        st.session_state.conversation_state = "ask_gender"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please enter a valid email address."})
 
-    elif current_state == "existing_user_info":
-        st.session_state.messages.append({"role": "assistant", "content": "Thank you for being an existing patient! For existing patients, please contact our support team at 123-456-7890 or log in to your patient portal for appointment management. Type 'Start Over' to go back to user selection."})
-        st.session_state.conversation_state = "offer_start_over"
+def _handle_get_gender(user_input: str):
+    if user_input.title() in _GENDER_SET: # .title() will capitalize first letter
+        st.session_state.new_patient_info["patient_demographics"]["gender"] = user_input.title()
+        st.session_state.conversation_state = "ask_address"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please select from: Male, Female, Non-binary, or Prefer not to say."})
 
-def process_response(user_input: str):
-    current_state = st.session_state.conversation_state
-    new_patient_info = st.session_state.new_patient_info
+def _handle_get_address(user_input: str):
+    # No Pydantic validation for address length in model, so basic check here
+    if len(user_input) >= 5:
+        st.session_state.new_patient_info["patient_demographics"]["address"] = user_input
+        st.session_state.conversation_state = "ask_preferred_language"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please provide a more complete address."})
 
-    # Handle general questions
-    if any(keyword in user_input.lower() for keyword in ["what is", "tell me about", "question about", "privacy", "hipaa", "npp"]):
-        st.session_state.messages.append({"role": "assistant", "content": "The Notice of Privacy Practices (NPP) describes how your medical information may be used and disclosed and your rights regarding that information. It outlines our commitment to protecting your health information. You can read the full text again here:\n\n" + st.session_state.npp_content})
-        # Re-ask the current question after providing the answer
-        ask_next_question() 
-        return
+def _handle_get_preferred_language(user_input: str):
+    if len(user_input) >= 2:
+        st.session_state.new_patient_info["patient_demographics"]["preferred_language"] = user_input
+        st.session_state.conversation_state = "ask_emergency_contact_name"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please provide your preferred language."})
 
-    # Process form inputs based on current state
-    if current_state == "user_type_selection":
-        if "new user" in user_input.lower():
-            st.session_state.user_type_chosen = "New User"
-            st.session_state.conversation_state = "display_npp"
-            ask_next_question()
-        elif "existing user" in user_input.lower():
-            st.session_state.user_type_chosen = "Existing User"
-            st.session_state.conversation_state = "existing_user_info"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "I didn't understand. Please type 'New User' or 'Existing User'."})
-
-    elif current_state == "npp_agreement":
-        if "yes" in user_input.lower():
-            st.session_state.npp_agreed = True
-            st.session_state.conversation_state = "ask_full_legal_name"
-            st.session_state.messages.append({"role": "assistant", "content": "Great! Let's start with your pre-appointment registration."})
-            ask_next_question()
-        elif "no" in user_input.lower():
-            st.session_state.npp_agreed = False
-            st.session_state.user_type_chosen = None # Go back to initial selection
-            st.session_state.conversation_state = "initial_greeting"
-            st.session_state.messages.append({"role": "assistant", "content": "Okay, returning to the start."})
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please respond with 'Yes' or 'No'."})
+# Emergency Contact
+def _handle_get_emergency_contact_name(user_input: str):
+    emergency_contact = st.session_state.new_patient_info["emergency_contact"]
+    if user_input.lower() == "skip":
+        emergency_contact.update({"name": None, "relationship": None, "phone": None})
+        st.session_state.conversation_state = "ask_primary_insurance_provider" # Skip to next section
+        ask_next_question()
+    elif len(user_input) >= 2:
+        emergency_contact["name"] = user_input
+        st.session_state.conversation_state = "ask_emergency_contact_relationship"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please enter a valid name or 'Skip'."})
 
-    # Demographics
-    elif current_state == "get_full_legal_name":
-        try:
-            # Temporarily create a PatientDemographics instance to validate just the name
-            # This requires dummy values for other fields to satisfy Pydantic's requirements
-            temp_demographics = PatientDemographics(
-                full_legal_name=user_input,
-                date_of_birth=date(2000, 1, 1), # Dummy value
-                gender="Male", # Dummy value
-                phone_number="1234567890", # Dummy value
-                email_address="dummy@example.com" # Dummy value
-            )
-            st.session_state.new_patient_info.setdefault("patient_demographics", {})["full_legal_name"] = user_input
-            st.session_state.conversation_state = "ask_date_of_birth"
-            ask_next_question()
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter a valid full legal name (2-100 characters)."})
+def _handle_get_emergency_contact_relationship(user_input: str):
+    if len(user_input) >= 2:
+        st.session_state.new_patient_info["emergency_contact"]["relationship"] = user_input
+        st.session_state.conversation_state = "ask_emergency_contact_phone"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please provide a relationship."})
 
-    elif current_state == "get_date_of_birth":
+def _handle_get_emergency_contact_phone(user_input: str):
+    if _valid_phone(user_input):
+        st.session_state.new_patient_info["emergency_contact"]["phone"] = user_input
+        st.session_state.conversation_state = "ask_primary_insurance_provider"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please enter a valid 10-digit phone number (numbers only)."})
+
+# Insurance and Financial
+def _handle_get_primary_insurance_provider(user_input: str):
+    try:
+        _adapters()["primary_insurance"].validate_python({**_DEFAULTS["primary_insurance"], "provider_name": user_input})
+        st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]["provider_name"] = user_input
+        st.session_state.conversation_state = "ask_primary_insurance_policy_number"
+        ask_next_question()
+    except ValidationError as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter the provider name."})
+
+def _handle_get_primary_insurance_policy_number(user_input: str):
+    try:
+        _adapters()["primary_insurance"].validate_python({**_DEFAULTS["primary_insurance"], "policy_number": user_input})
+        st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]["policy_number"] = user_input
+        st.session_state.conversation_state = "ask_primary_insurance_group_number"
+        ask_next_question()
+    except ValidationError as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter a valid policy number (at least 5 characters)."})
+
+def _handle_get_primary_insurance_group_number(user_input: str):
+    primary_insurance = st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]
+    primary_insurance["group_number"] = user_input if user_input.lower() != "none" else None
+    st.session_state.conversation_state = "ask_primary_insurance_subscriber_name"
+    ask_next_question()
+
+def _handle_get_primary_insurance_subscriber_name(user_input: str):
+    # subscriber_name is not in the Pydantic model for PrimaryInsurance, only subscriber_dob
+    # So, no Pydantic validation here for 'subscriber_name' itself.
+    primary_insurance = st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]
+    primary_insurance["subscriber_name"] = user_input if user_input.lower() != "same" else None
+    st.session_state.conversation_state = "ask_primary_insurance_subscriber_dob"
+    ask_next_question()
+
+def _handle_get_primary_insurance_subscriber_dob(user_input: str):
+    primary_insurance = st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]
+    if user_input.lower() == "skip":
+        primary_insurance["subscriber_dob"] = None
+        st.session_state.conversation_state = "ask_secondary_insurance_yn"
+        ask_next_question()
+    else:
         try:
             dob = date.fromisoformat(user_input)
-            # Dummy values for other required fields to validate date_of_birth
-            PatientDemographics(
-                full_legal_name="Dummy Name", 
-                date_of_birth=dob, 
-                gender="Male", 
-                address="N/A", 
-                phone_number="1234567890", 
-                email_address="test@example.com"
-            )
-            st.session_state.new_patient_info.setdefault("patient_demographics", {})["date_of_birth"] = dob.isoformat()
-            st.session_state.conversation_state = "ask_phone_number"
+            _adapters()["past_date"].validate_python(dob)
+            new_dob = dob.isoformat()
+            if primary_insurance.get("subscriber_dob") != new_dob:
+                primary_insurance["subscriber_dob"] = new_dob
+            st.session_state.conversation_state = "ask_secondary_insurance_yn"
             ask_next_question()
         except ValueError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Invalid date format or age. {e}. Please use YYYY-MM-DD."})
-        except ValidationError as e:
-            # More specific error message from Pydantic validator
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please use YYYY-MM-DD."})
-
-    elif current_state == "get_phone_number":
-        try:
-            # Use dummy data to validate just the phone number field
-            temp_demographics = PatientDemographics(
-                full_legal_name="Dummy Name",
-                date_of_birth=date(2000, 1, 1),
-                gender="Male",
-                phone_number=user_input,
-                email_address="dummy@example.com"
-            )
-            st.session_state.new_patient_info.setdefault("patient_demographics", {})["phone_number"] = user_input
-            st.session_state.conversation_state = "ask_email_address"
-            ask_next_question()
+            st.session_state.messages.append({"role": "assistant", "content": f"Invalid date format. {e}. Please use YYYY-MM-DD or 'Skip'."})
         except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter a valid 10-digit phone number (numbers only)."})
-
-    elif current_state == "get_email_address":
-        try:
-            temp_demographics = PatientDemographics(
-                full_legal_name="Dummy Name",
-                date_of_birth=date(2000, 1, 1),
-                gender="Male",
-                phone_number="1234567890",
-                email_address=user_input
-            )
-            st.session_state.new_patient_info.setdefault("patient_demographics", {})["email_address"] = user_input
-            st.session_state.conversation_state = "ask_gender"
-            ask_next_question()
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter a valid email address."})
-
-    elif current_state == "get_gender":
-        gender_options = ["Male", "Female", "Non-binary", "Prefer not to say"]
-        if user_input.title() in gender_options: # .title() will capitalize first letter
-            st.session_state.new_patient_info.setdefault("patient_demographics", {})["gender"] = user_input.title()
-            st.session_state.conversation_state = "ask_address"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please select from: Male, Female, Non-binary, or Prefer not to say."})
-
-    elif current_state == "get_address":
-        # No Pydantic validation for address length in model, so basic check here
-        if len(user_input) >= 5: 
-            st.session_state.new_patient_info.setdefault("patient_demographics", {})["address"] = user_input
-            st.session_state.conversation_state = "ask_preferred_language"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please provide a more complete address."})
-    
-    elif current_state == "get_preferred_language":
-        if len(user_input) >= 2:
-            st.session_state.new_patient_info.setdefault("patient_demographics", {})["preferred_language"] = user_input
-            st.session_state.conversation_state = "ask_emergency_contact_name"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please provide your preferred language."})
-
-    # Emergency Contact
-    elif current_state == "get_emergency_contact_name":
-        if user_input.lower() == "skip":
-            st.session_state.new_patient_info.setdefault("emergency_contact", {})["name"] = None
-            st.session_state.new_patient_info["emergency_contact"]["relationship"] = None
-            st.session_state.new_patient_info["emergency_contact"]["phone"] = None
-            st.session_state.conversation_state = "ask_primary_insurance_provider" # Skip to next section
-            ask_next_question()
-        elif len(user_input) >= 2:
-            st.session_state.new_patient_info.setdefault("emergency_contact", {})["name"] = user_input
-            st.session_state.conversation_state = "ask_emergency_contact_relationship"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please enter a valid name or 'Skip'."})
-
-    elif current_state == "get_emergency_contact_relationship":
-        if len(user_input) >= 2:
-            st.session_state.new_patient_info["emergency_contact"]["relationship"] = user_input
-            st.session_state.conversation_state = "ask_emergency_contact_phone"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please provide a relationship."})
+            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please use YYYY-MM-DD or 'Skip'."})
 
-    elif current_state == "get_emergency_contact_phone":
-        try:
-            # Use dummy values for name and relationship for validation
-            temp_contact = EmergencyContact(
-                name="Dummy",
-                relationship="Dummy",
-                phone=user_input
-            )
-            st.session_state.new_patient_info["emergency_contact"]["phone"] = user_input
-            st.session_state.conversation_state = "ask_primary_insurance_provider"
-            ask_next_question()
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter a valid 10-digit phone number (numbers only)."})
+def _handle_get_secondary_insurance_yn(user_input: str):
+    secondary_insurance = st.session_state.new_patient_info["insurance_and_financial"]["secondary_insurance"]
+    if "yes" in user_input.lower():
+        secondary_insurance["has_secondary_insurance"] = True
+        st.session_state.conversation_state = "ask_secondary_insurance_provider"
+        ask_next_question()
+    elif "no" in user_input.lower():
+        secondary_insurance.update({"has_secondary_insurance": False, "provider_name": None, "policy_number": None})
+        st.session_state.conversation_state = "ask_reason_for_visit_brief"
+        ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
 
-    # Insurance and Financial
-    elif current_state == "get_primary_insurance_provider":
-        try:
-            temp_insurance = PrimaryInsurance(
-                provider_name=user_input,
-                policy_number="dummy" * 5 # Satisfy min_length for policy_number
-            )
-            st.session_state.new_patient_info.setdefault("insurance_and_financial", {}).setdefault("primary_insurance", {})["provider_name"] = user_input
-            st.session_state.conversation_state = "ask_primary_insurance_policy_number"
-            ask_next_question()
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter the provider name."})
+def _handle_get_secondary_insurance_provider(user_input: str):
+    secondary_insurance = st.session_state.new_patient_info["insurance_and_financial"]["secondary_insurance"]
+    try:
+        # Need to create a partial SecondaryInsurance model for validation
+        temp_secondary_insurance = SecondaryInsurance(
+            has_secondary_insurance=True, # Must be True to trigger validation for provider_name
+            provider_name=user_input,
+            policy_number="Dummy12345" # Dummy value to satisfy min_length
+        )
+        secondary_insurance["provider_name"] = user_input
+        st.session_state.conversation_state = "ask_secondary_insurance_policy_number"
+        ask_next_question()
+    except ValidationError as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please provide the secondary insurance provider name."})
+
+def _handle_get_secondary_insurance_policy_number(user_input: str):
+    secondary_insurance = st.session_state.new_patient_info["insurance_and_financial"]["secondary_insurance"]
+    try:
+        temp_secondary_insurance = SecondaryInsurance(
+            has_secondary_insurance=True,
+            provider_name="Dummy",
+            policy_number=user_input
+        )
+        secondary_insurance["policy_number"] = user_input
+        st.session_state.conversation_state = "ask_reason_for_visit_brief"
+        ask_next_question()
+    except ValidationError as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please provide the secondary insurance policy number."})
+
+def _handle_get_reason_for_visit_brief(user_input: str):
+    try:
+        # To validate reason_for_visit_brief, we need to provide dummy data for PrimaryInsurance
+        # and SecondaryInsurance, and financial_responsibility_acknowledged.
+        temp_insurance_financial = InsuranceAndFinancial(
+            primary_insurance=PrimaryInsurance(provider_name="D", policy_number="12345"),
+            secondary_insurance=SecondaryInsurance(has_secondary_insurance=False),
+            reason_for_visit_brief=user_input,
+            financial_responsibility_acknowledged=True
+        )
+        st.session_state.new_patient_info["insurance_and_financial"]["reason_for_visit_brief"] = user_input
+        st.session_state.conversation_state = "ask_financial_responsibility"
+        ask_next_question()
+    except ValidationError as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please provide a brief reason for your visit (at least 5 characters)."})
 
-    elif current_state == "get_primary_insurance_policy_number":
-        try:
-            temp_insurance = PrimaryInsurance(
-                provider_name="Dummy",
-                policy_number=user_input
-            )
-            st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]["policy_number"] = user_input
-            st.session_state.conversation_state = "ask_primary_insurance_group_number"
-            ask_next_question()
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please enter a valid policy number (at least 5 characters)."})
+def _handle_get_financial_responsibility(user_input: str):
+    if "yes" in user_input.lower():
+        st.session_state.new_patient_info["insurance_and_financial"]["financial_responsibility_acknowledged"] = True
+        st.session_state.conversation_state = "ask_medical_history_opt_in"
+        ask_next_question()
+    elif "no" in user_input.lower():
+        st.session_state.messages.append({"role": "assistant", "content": "You must acknowledge financial responsibility to proceed. Please type 'Yes'."})
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
 
-    elif current_state == "get_primary_insurance_group_number":
-        st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]["group_number"] = user_input if user_input.lower() != "none" else None
-        st.session_state.conversation_state = "ask_primary_insurance_subscriber_name"
+# Medical History
+def _handle_get_medical_history_opt_in(user_input: str):
+    medical_history = st.session_state.new_patient_info["medical_history_overview"]
+    if "yes" in user_input.lower():
+        medical_history["opt_in"] = True
+        st.session_state.conversation_state = "ask_reason_for_appointment_full"
         ask_next_question()
-    
-    elif current_state == "get_primary_insurance_subscriber_name":
-        # subscriber_name is not in the Pydantic model for PrimaryInsurance, only subscriber_dob
-        # So, no Pydantic validation here for 'subscriber_name' itself.
-        st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]["subscriber_name"] = user_input if user_input.lower() != "same" else None
-        st.session_state.conversation_state = "ask_primary_insurance_subscriber_dob"
+    elif "no" in user_input.lower():
+        # Clear any previously entered medical history details if user opts out
+        medical_history.update({
+            "opt_in": False,
+            "reason_for_appointment_full": None,
+            "known_allergies": None,
+            "current_medications": None,
+            "major_past_medical_conditions": None,
+            "referring_physician": None,
+        })
+        st.session_state.conversation_state = "ask_desired_appointment_date" # Skip medical history details
         ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
 
-    elif current_state == "get_primary_insurance_subscriber_dob":
-        if user_input.lower() == "skip":
-            st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]["subscriber_dob"] = None
-            st.session_state.conversation_state = "ask_secondary_insurance_yn"
-            ask_next_question()
-        else:
-            try:
-                dob = date.fromisoformat(user_input)
-                # Need to provide other required fields for PrimaryInsurance validation
-                PrimaryInsurance(
-                    provider_name=st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"].get("provider_name", "Dummy"),
-                    policy_number=st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"].get("policy_number", "Dummy123"),
-                    subscriber_dob=dob
-                )
-                st.session_state.new_patient_info["insurance_and_financial"]["primary_insurance"]["subscriber_dob"] = dob.isoformat()
-                st.session_state.conversation_state = "ask_secondary_insurance_yn"
-                ask_next_question()
-            except ValueError as e:
-                st.session_state.messages.append({"role": "assistant", "content": f"Invalid date format. {e}. Please use YYYY-MM-DD or 'Skip'."})
-            except ValidationError as e:
-                st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please use YYYY-MM-DD or 'Skip'."})
-
-    elif current_state == "get_secondary_insurance_yn":
-        if "yes" in user_input.lower():
-            st.session_state.new_patient_info.setdefault("insurance_and_financial", {}).setdefault("secondary_insurance", {})["has_secondary_insurance"] = True
-            st.session_state.conversation_state = "ask_secondary_insurance_provider"
-            ask_next_question()
-        elif "no" in user_input.lower():
-            st.session_state.new_patient_info.setdefault("insurance_and_financial", {}).setdefault("secondary_insurance", {})["has_secondary_insurance"] = False
-            st.session_state.new_patient_info["insurance_and_financial"]["secondary_insurance"]["provider_name"] = None
-            st.session_state.new_patient_info["insurance_and_financial"]["secondary_insurance"]["policy_number"] = None
-            st.session_state.conversation_state = "ask_reason_for_visit_brief"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
-
-    elif current_state == "get_secondary_insurance_provider":
-        try:
-            # Need to create a partial SecondaryInsurance model for validation
-            temp_secondary_insurance = SecondaryInsurance(
-                has_secondary_insurance=True, # Must be True to trigger validation for provider_name
-                provider_name=user_input,
-                policy_number="Dummy12345" # Dummy value to satisfy min_length
-            )
-            st.session_state.new_patient_info["insurance_and_financial"]["secondary_insurance"]["provider_name"] = user_input
-            st.session_state.conversation_state = "ask_secondary_insurance_policy_number"
-            ask_next_question()
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please provide the secondary insurance provider name."})
+# The optional medical-history questions all follow the same shape: store the
+# reply (a sentinel word means None) and advance. One table plus a generic
+# handler covers them instead of five copies of the same function.
+# field -> (sentinel, next_state)
+_MEDICAL_HISTORY_FIELDS = {
+    "reason_for_appointment_full": ("skip", "ask_known_allergies"),
+    "known_allergies": ("none", "ask_current_medications"),
+    "current_medications": ("none", "ask_major_past_medical_conditions"),
+    "major_past_medical_conditions": ("none", "ask_referring_physician"),
+    "referring_physician": ("none", "ask_desired_appointment_date"),
+}
+
+def _handle_medical_history_field(field: str, user_input: str):
+    sentinel, next_state = _MEDICAL_HISTORY_FIELDS[field]
+    st.session_state.new_patient_info["medical_history_overview"][field] = user_input if user_input.lower() != sentinel else None
+    st.session_state.conversation_state = next_state
+    ask_next_question()
+
+# Appointment Details
+def _handle_get_desired_appointment_date(user_input: str):
+    try:
+        app_date = date.fromisoformat(user_input)
+        # Same rule as AppointmentDetails.validate_desired_appointment_date;
+        # checking it directly avoids running a whole model validation padded
+        # with a dummy time just to vet one date.
+        if app_date < _today():
+            raise ValueError('Desired appointment date cannot be in the past.')
+        st.session_state.new_patient_info["appointment_details"]["desired_appointment_date"] = app_date.isoformat()
+        st.session_state.conversation_state = "ask_desired_appointment_time"
+        ask_next_question()
+    except ValueError as e:
+        st.session_state.messages.append({"role": "assistant", "content": f"Invalid date format or date in past. {e}. Please use YYYY-MM-DD and ensure it's not in the past."})
+
+def _handle_get_desired_appointment_time(user_input: str):
+    try:
+        # Handle HH:MM AM/PM input
+        if "am" in user_input.lower() or "pm" in user_input.lower():
+            app_time = datetime.strptime(user_input.upper(), "%I:%M %p").time()
+        else: # Assume 24-hour format if no AM/PM
+            app_time = time.fromisoformat(user_input)
+
+        st.session_state.new_patient_info["appointment_details"]["desired_appointment_time"] = app_time.isoformat()
+        st.session_state.conversation_state = "ask_preferred_provider"
+        ask_next_question()
+    except ValueError:
+        st.session_state.messages.append({"role": "assistant", "content": "Invalid time format. Please use HH:MM AM/PM (e.g., 10:30 AM) or HH:MM (e.g., 14:00)."})
+
+def _handle_get_preferred_provider(user_input: str):
+    st.session_state.new_patient_info["appointment_details"]["preferred_provider"] = user_input if user_input.lower() != "none" else None
+    st.session_state.conversation_state = "ask_special_needs"
+    ask_next_question()
+
+def _handle_get_special_needs(user_input: str):
+    st.session_state.new_patient_info["appointment_details"]["special_needs"] = user_input if user_input.lower() != "none" else None
+    st.session_state.conversation_state = "ask_consent_for_treatment"
+    ask_next_question()
+
+# Legal Compliance
+def _handle_get_consent_for_treatment(user_input: str):
+    if "yes" in user_input.lower():
+        st.session_state.new_patient_info["legal_compliance"]["consent_for_treatment_acknowledged"] = True
+        st.session_state.conversation_state = "ask_hipaa_privacy_acknowledged"
+        ask_next_question()
+    elif "no" in user_input.lower():
+        st.session_state.messages.append({"role": "assistant", "content": "You must acknowledge consent for treatment to proceed. Please type 'Yes'."})
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
 
-    elif current_state == "get_secondary_insurance_policy_number":
-        try:
-            temp_secondary_insurance = SecondaryInsurance(
-                has_secondary_insurance=True,
-                provider_name="Dummy",
-                policy_number=user_input
-            )
-            st.session_state.new_patient_info["insurance_and_financial"]["secondary_insurance"]["policy_number"] = user_input
-            st.session_state.conversation_state = "ask_reason_for_visit_brief"
-            ask_next_question()
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please provide the secondary insurance policy number."})
+def _handle_get_hipaa_privacy_acknowledged(user_input: str):
+    if "yes" in user_input.lower():
+        st.session_state.new_patient_info["legal_compliance"]["hipaa_privacy_acknowledged"] = True
+        st.session_state.conversation_state = "review_and_submit"
+        ask_next_question()
+    elif "no" in user_input.lower():
+        st.session_state.messages.append({"role": "assistant", "content": "You must acknowledge HIPAA privacy practices to proceed. Please type 'Yes'."})
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
 
-    elif current_state == "get_reason_for_visit_brief":
+# Final Submission
+def _handle_await_final_submission(user_input: str):
+    if "submit" in user_input.lower():
         try:
-            # To validate reason_for_visit_brief, we need to provide dummy data for PrimaryInsurance
-            # and SecondaryInsurance, and financial_responsibility_acknowledged.
-            temp_insurance_financial = InsuranceAndFinancial(
-                primary_insurance=PrimaryInsurance(provider_name="D", policy_number="12345"),
-                secondary_insurance=SecondaryInsurance(has_secondary_insurance=False),
-                reason_for_visit_brief=user_input,
-                financial_responsibility_acknowledged=True
-            )
-            st.session_state.new_patient_info.setdefault("insurance_and_financial", {})["reason_for_visit_brief"] = user_input
-            st.session_state.conversation_state = "ask_financial_responsibility"
+            # Ensure all necessary nested dictionaries and boolean flags are present for Pydantic validation
+            # The data structure needs to match the PatientPreAppointmentInfo model exactly.
+            # One dict merge per section backfills any required field not yet collected
+            # with its default from _DEFAULTS.
+            npi = st.session_state.new_patient_info
+            patient_demographics_data = {**_DEFAULTS["patient_demographics"], **npi["patient_demographics"]}
+            emergency_contact_data = npi["emergency_contact"]
+            insurance_and_financial_data = {**_DEFAULTS["insurance_and_financial"], **npi["insurance_and_financial"]}
+            insurance_and_financial_data["primary_insurance"] = {**_DEFAULTS["primary_insurance"], **insurance_and_financial_data.get("primary_insurance", {})}
+            insurance_and_financial_data["secondary_insurance"] = {**_DEFAULTS["secondary_insurance"], **insurance_and_financial_data.get("secondary_insurance", {})}
+            medical_history_overview_data = {**_DEFAULTS["medical_history_overview"], **npi["medical_history_overview"]}
+            legal_compliance_data = {**_DEFAULTS["legal_compliance"], **npi["legal_compliance"]}
+
+            # AppointmentDetails defaults depend on the current date, so they are
+            # filled here rather than in the static template.
+            appointment_details_data = npi["appointment_details"]
+            if "desired_appointment_date" not in appointment_details_data: appointment_details_data["desired_appointment_date"] = _today().isoformat()
+            if "desired_appointment_time" not in appointment_details_data: appointment_details_data["desired_appointment_time"] = time(9,0).isoformat()
+
+            full_data = {
+                "patient_demographics": patient_demographics_data,
+                "emergency_contact": emergency_contact_data,
+                "insurance_and_financial": insurance_and_financial_data,
+                "medical_history_overview": medical_history_overview_data,
+                "appointment_details": appointment_details_data,
+                "legal_compliance": legal_compliance_data,
+            }
+
+            # Re-submitting the same data (e.g. 'Submit' after a 'Back' with no
+            # edits) reuses the previous validation instead of re-running the
+            # full nested model over unchanged input.
+            data_hash = hash(json.dumps(full_data, sort_keys=True, default=str))
+            if st.session_state.get("_validated_hash") == data_hash:
+                validated_info = st.session_state._validated_info
+            else:
+                validated_info = _adapters()["full"].validate_python(full_data)
+                st.session_state._validated_hash = data_hash
+                st.session_state._validated_info = validated_info
+            st.session_state.messages.append({"role": "assistant", "content": "Form data is valid and ready for backend submission!"})
+            st.session_state.messages.append({"role": "assistant", "content": f"```json\n{validated_info.model_dump_json(indent=4)}\n```"})
+            st.session_state.conversation_state = "submission_complete"
             ask_next_question()
         except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please provide a brief reason for your visit (at least 5 characters)."})
-
-    elif current_state == "get_financial_responsibility":
-        if "yes" in user_input.lower():
-            st.session_state.new_patient_info.setdefault("insurance_and_financial", {})["financial_responsibility_acknowledged"] = True
-            st.session_state.conversation_state = "ask_medical_history_opt_in"
-            ask_next_question()
-        elif "no" in user_input.lower():
-            st.session_state.messages.append({"role": "assistant", "content": "You must acknowledge financial responsibility to proceed. Please type 'Yes'."})
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
-
-    # Medical History
-    elif current_state == "get_medical_history_opt_in":
-        if "yes" in user_input.lower():
-            st.session_state.new_patient_info.setdefault("medical_history_overview", {})["opt_in"] = True
-            st.session_state.conversation_state = "ask_reason_for_appointment_full"
-            ask_next_question()
-        elif "no" in user_input.lower():
-            st.session_state.new_patient_info.setdefault("medical_history_overview", {})["opt_in"] = False
-            # Clear any previously entered medical history details if user opts out
-            st.session_state.new_patient_info["medical_history_overview"]["reason_for_appointment_full"] = None
-            st.session_state.new_patient_info["medical_history_overview"]["known_allergies"] = None
-            st.session_state.new_patient_info["medical_history_overview"]["current_medications"] = None
-            st.session_state.new_patient_info["medical_history_overview"]["major_past_medical_conditions"] = None
-            st.session_state.new_patient_info["medical_history_overview"]["referring_physician"] = None
-            st.session_state.conversation_state = "ask_desired_appointment_date" # Skip medical history details
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
-
-    elif current_state == "get_reason_for_appointment_full":
-        st.session_state.new_patient_info.setdefault("medical_history_overview", {})["reason_for_appointment_full"] = user_input if user_input.lower() != "skip" else None
-        st.session_state.conversation_state = "ask_known_allergies"
+            st.session_state.messages.append({"role": "assistant", "content": "Validation Errors Detected! Please review your input. Here are the errors:"})
+            for error in e.errors():
+                field = ".".join(error['loc'])
+                message = error['msg']
+                st.session_state.messages.append({"role": "assistant", "content": f"❌ **Error in `{field}`:** {message}"})
+            st.session_state.messages.append({"role": "assistant", "content": "Type 'Back' to go to the last section with errors or 'Submit' again if you think it's correct after review."})
+
+    elif "back" in user_input.lower():
+        # This 'Back' logic is simplified for chatbot.
+        # In a real app, you'd need to track previous states more granularly.
+        st.session_state.conversation_state = "ask_hipaa_privacy_acknowledged" # Go back to the last form section
         ask_next_question()
-
-    elif current_state == "get_known_allergies":
-        st.session_state.new_patient_info.setdefault("medical_history_overview", {})["known_allergies"] = user_input if user_input.lower() != "none" else None
-        st.session_state.conversation_state = "ask_current_medications"
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please type 'Submit' to finalize or 'Back' to review."})
+
+# Session keys holding memoized results; dropped on reset so a fresh intake
+# recomputes them.
+_MEMO_KEYS = ("_validated_hash", "_validated_info")
+
+def _reset_session():
+    # Reset only the keys this app owns; a blanket clear() would also drop
+    # the NPP text and widget state and force them to be rebuilt.
+    st.session_state.messages = []
+    st.session_state.conversation_state = "initial_greeting"
+    st.session_state.new_patient_info = copy.deepcopy(_EMPTY_SKELETON)
+    st.session_state.npp_agreed = False
+    for key in _MEMO_KEYS:
+        st.session_state.pop(key, None)
+
+def _handle_offer_start_over(user_input: str):
+    if "start over" in user_input.lower():
+        _reset_session()
         ask_next_question()
+    else:
+        st.session_state.messages.append({"role": "assistant", "content": "Please type 'Start Over' or continue."})
+
+# Dispatch table: conversation state -> handler for the user's reply.
+_HANDLERS = {
+    "user_type_selection": _handle_user_type_selection,
+    "npp_agreement": _handle_npp_agreement,
+    "get_full_legal_name": _handle_get_full_legal_name,
+    "get_date_of_birth": _handle_get_date_of_birth,
+    "get_phone_number": _handle_get_phone_number,
+    "get_email_address": _handle_get_email_address,
+    "get_gender": _handle_get_gender,
+    "get_address": _handle_get_address,
+    "get_preferred_language": _handle_get_preferred_language,
+    "get_emergency_contact_name": _handle_get_emergency_contact_name,
+    "get_emergency_contact_relationship": _handle_get_emergency_contact_relationship,
+    "get_emergency_contact_phone": _handle_get_emergency_contact_phone,
+    "get_primary_insurance_provider": _handle_get_primary_insurance_provider,
+    "get_primary_insurance_policy_number": _handle_get_primary_insurance_policy_number,
+    "get_primary_insurance_group_number": _handle_get_primary_insurance_group_number,
+    "get_primary_insurance_subscriber_name": _handle_get_primary_insurance_subscriber_name,
+    "get_primary_insurance_subscriber_dob": _handle_get_primary_insurance_subscriber_dob,
+    "get_secondary_insurance_yn": _handle_get_secondary_insurance_yn,
+    "get_secondary_insurance_provider": _handle_get_secondary_insurance_provider,
+    "get_secondary_insurance_policy_number": _handle_get_secondary_insurance_policy_number,
+    "get_reason_for_visit_brief": _handle_get_reason_for_visit_brief,
+    "get_financial_responsibility": _handle_get_financial_responsibility,
+    "get_medical_history_opt_in": _handle_get_medical_history_opt_in,
+    "get_reason_for_appointment_full": functools.partial(_handle_medical_history_field, "reason_for_appointment_full"),
+    "get_known_allergies": functools.partial(_handle_medical_history_field, "known_allergies"),
+    "get_current_medications": functools.partial(_handle_medical_history_field, "current_medications"),
+    "get_major_past_medical_conditions": functools.partial(_handle_medical_history_field, "major_past_medical_conditions"),
+    "get_referring_physician": functools.partial(_handle_medical_history_field, "referring_physician"),
+    "get_desired_appointment_date": _handle_get_desired_appointment_date,
+    "get_desired_appointment_time": _handle_get_desired_appointment_time,
+    "get_preferred_provider": _handle_get_preferred_provider,
+    "get_special_needs": _handle_get_special_needs,
+    "get_consent_for_treatment": _handle_get_consent_for_treatment,
+    "get_hipaa_privacy_acknowledged": _handle_get_hipaa_privacy_acknowledged,
+    "await_final_submission": _handle_await_final_submission,
+    "offer_start_over": _handle_offer_start_over,
+}
+
+# Phrases that divert any input into the NPP question-answer branch.
+_NPP_KEYWORDS = ("what is", "tell me about", "question about", "privacy", "hipaa", "npp")
 
-    elif current_state == "get_current_medications":
-        st.session_state.new_patient_info.setdefault("medical_history_overview", {})["current_medications"] = user_input if user_input.lower() != "none" else None
-        st.session_state.conversation_state = "ask_major_past_medical_conditions"
+def process_response(user_input: str):
+    # Handle general questions
+    if any(keyword in user_input.lower() for keyword in _NPP_KEYWORDS):
+        st.session_state.messages.append({"role": "assistant", "content": _npp_answer_message(st.session_state.npp_content)})
+        # Re-ask the current question after providing the answer
         ask_next_question()
+        return
 
-    elif current_state == "get_major_past_medical_conditions":
-        st.session_state.new_patient_info.setdefault("medical_history_overview", {})["major_past_medical_conditions"] = user_input if user_input.lower() != "none" else None
-        st.session_state.conversation_state = "ask_referring_physician"
-        ask_next_question()
+    # Process form inputs based on current state
+    handler = _HANDLERS.get(st.session_state.conversation_state)
+    if handler is not None:
+        handler(user_input)
 
-    elif current_state == "get_referring_physician":
-        st.session_state.new_patient_info.setdefault("medical_history_overview", {})["referring_physician"] = user_input if user_input.lower() != "none" else None
-        st.session_state.conversation_state = "ask_desired_appointment_date"
-        ask_next_question()
 
-    # Appointment Details
-    elif current_state == "get_desired_appointment_date":
-        try:
-            app_date = date.fromisoformat(user_input)
-            # Dummy time for Pydantic validation of date
-            AppointmentDetails(
-                desired_appointment_date=app_date, desired_appointment_time=time(9,0)
-            )
-            st.session_state.new_patient_info.setdefault("appointment_details", {})["desired_appointment_date"] = app_date.isoformat()
-            st.session_state.conversation_state = "ask_desired_appointment_time"
-            ask_next_question()
-        except ValueError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Invalid date format or date in past. {e}. Please use YYYY-MM-DD and ensure it's not in the past."})
-        except ValidationError as e:
-            st.session_state.messages.append({"role": "assistant", "content": f"Validation error: {e.errors()[0]['msg']}. Please use YYYY-MM-DD and ensure it's not in the past."})
+# The whole conversation lives in one fragment: submitting a chat message
+# reruns only this function, so page config, title and session bootstrap in
+# app() are not re-executed per message.
+@st.fragment
+def _conversation():
+    # Refresh the per-run date cache so _today() is constant for this run
+    st.session_state._today_cached = date.today()
 
-    elif current_state == "get_desired_appointment_time":
-        try:
-            # Handle HH:MM AM/PM input
-            if "am" in user_input.lower() or "pm" in user_input.lower():
-                app_time = datetime.strptime(user_input.upper(), "%I:%M %p").time()
-            else: # Assume 24-hour format if no AM/PM
-                app_time = time.fromisoformat(user_input)
-            
-            st.session_state.new_patient_info.setdefault("appointment_details", {})["desired_appointment_time"] = app_time.isoformat()
-            st.session_state.conversation_state = "ask_preferred_provider"
-            ask_next_question()
-        except ValueError:
-            st.session_state.messages.append({"role": "assistant", "content": "Invalid time format. Please use HH:MM AM/PM (e.g., 10:30 AM) or HH:MM (e.g., 14:00)."})
+    # Display chat messages from history on app rerun
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
 
-    elif current_state == "get_preferred_provider":
-        st.session_state.new_patient_info.setdefault("appointment_details", {})["preferred_provider"] = user_input if user_input.lower() != "none" else None
-        st.session_state.conversation_state = "ask_special_needs"
+    # If this is the first run or after a restart, ask the initial question
+    if not st.session_state.messages or st.session_state.messages[-1]["role"] == "user":
+        # Only ask the next question if the last message was from the user or it's the very first load
         ask_next_question()
 
-    elif current_state == "get_special_needs":
-        st.session_state.new_patient_info.setdefault("appointment_details", {})["special_needs"] = user_input if user_input.lower() != "none" else None
-        st.session_state.conversation_state = "ask_consent_for_treatment"
-        ask_next_question()
-    
-    # Legal Compliance
-    elif current_state == "get_consent_for_treatment":
-        if "yes" in user_input.lower():
-            st.session_state.new_patient_info.setdefault("legal_compliance", {})["consent_for_treatment_acknowledged"] = True
-            st.session_state.conversation_state = "ask_hipaa_privacy_acknowledged"
-            ask_next_question()
-        elif "no" in user_input.lower():
-            st.session_state.messages.append({"role": "assistant", "content": "You must acknowledge consent for treatment to proceed. Please type 'Yes'."})
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
-    
-    elif current_state == "get_hipaa_privacy_acknowledged":
-        if "yes" in user_input.lower():
-            st.session_state.new_patient_info.setdefault("legal_compliance", {})["hipaa_privacy_acknowledged"] = True
-            st.session_state.conversation_state = "review_and_submit"
-            ask_next_question()
-        elif "no" in user_input.lower():
-            st.session_state.messages.append({"role": "assistant", "content": "You must acknowledge HIPAA privacy practices to proceed. Please type 'Yes'."})
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please answer 'Yes' or 'No'."})
-
-    # Final Submission
-    elif current_state == "await_final_submission":
-        if "submit" in user_input.lower():
-            try:
-                # Ensure all necessary nested dictionaries and boolean flags are present for Pydantic validation
-                # The data structure needs to match the PatientPreAppointmentInfo model exactly
-                
-                # Default values for potentially missing nested dicts
-                patient_demographics_data = st.session_state.new_patient_info.get("patient_demographics", {})
-                emergency_contact_data = st.session_state.new_patient_info.get("emergency_contact", {})
-                insurance_and_financial_data = st.session_state.new_patient_info.get("insurance_and_financial", {})
-                medical_history_overview_data = st.session_state.new_patient_info.get("medical_history_overview", {})
-                appointment_details_data = st.session_state.new_patient_info.get("appointment_details", {})
-                legal_compliance_data = st.session_state.new_patient_info.get("legal_compliance", {})
-
-                # Ensure required sub-models and their required fields have dummy or default values if not yet collected
-                # This is crucial for Pydantic to attempt validation of the whole structure.
-                
-                # PatientDemographics
-                # All fields are required except address, which defaults to ""
-                if "full_legal_name" not in patient_demographics_data: patient_demographics_data["full_legal_name"] = "Temp Name"
-                if "date_of_birth" not in patient_demographics_data: patient_demographics_data["date_of_birth"] = date(2000, 1, 1).isoformat()
-                if "gender" not in patient_demographics_data: patient_demographics_data["gender"] = "Male"
-                if "phone_number" not in patient_demographics_data: patient_demographics_data["phone_number"] = "1234567890"
-                if "email_address" not in patient_demographics_data: patient_demographics_data["email_address"] = "temp@example.com"
-                
-                # PrimaryInsurance
-                primary_insurance_data = insurance_and_financial_data.get("primary_insurance", {})
-                if "provider_name" not in primary_insurance_data: primary_insurance_data["provider_name"] = "Temp Provider"
-                if "policy_number" not in primary_insurance_data: primary_insurance_data["policy_number"] = "TEMP12345"
-                insurance_and_financial_data["primary_insurance"] = primary_insurance_data
-
-                # SecondaryInsurance
-                secondary_insurance_data = insurance_and_financial_data.get("secondary_insurance", {})
-                if "has_secondary_insurance" not in secondary_insurance_data: secondary_insurance_data["has_secondary_insurance"] = False
-                insurance_and_financial_data["secondary_insurance"] = secondary_insurance_data
-
-                # InsuranceAndFinancial
-                if "reason_for_visit_brief" not in insurance_and_financial_data: insurance_and_financial_data["reason_for_visit_brief"] = "Temp Reason"
-                if "financial_responsibility_acknowledged" not in insurance_and_financial_data: insurance_and_financial_data["financial_responsibility_acknowledged"] = False
-
-                # MedicalHistoryOverview
-                if "opt_in" not in medical_history_overview_data: medical_history_overview_data["opt_in"] = False
-
-                # AppointmentDetails
-                if "desired_appointment_date" not in appointment_details_data: appointment_details_data["desired_appointment_date"] = date.today().isoformat()
-                if "desired_appointment_time" not in appointment_details_data: appointment_details_data["desired_appointment_time"] = time(9,0).isoformat()
-
-                # LegalCompliance
-                if "consent_for_treatment_acknowledged" not in legal_compliance_data: legal_compliance_data["consent_for_treatment_acknowledged"] = False
-                if "hipaa_privacy_acknowledged" not in legal_compliance_data: legal_compliance_data["hipaa_privacy_acknowledged"] = False
-
-                full_data = {
-                    "patient_demographics": patient_demographics_data,
-                    "emergency_contact": emergency_contact_data,
-                    "insurance_and_financial": insurance_and_financial_data,
-                    "medical_history_overview": medical_history_overview_data,
-                    "appointment_details": appointment_details_data,
-                    "legal_compliance": legal_compliance_data,
-                }
-                
-                validated_info = PatientPreAppointmentInfo(**full_data)
-                st.session_state.messages.append({"role": "assistant", "content": "Form data is valid and ready for backend submission!"})
-                st.session_state.messages.append({"role": "assistant", "content": f"```json\n{json.dumps(validated_info.dict(), indent=4)}\n```"})
-                st.session_state.conversation_state = "submission_complete"
-                ask_next_question()
-            except ValidationError as e:
-                st.session_state.messages.append({"role": "assistant", "content": "Validation Errors Detected! Please review your input. Here are the errors:"})
-                for error in e.errors():
-                    field = ".".join(error['loc'])
-                    message = error['msg']
-                    st.session_state.messages.append({"role": "assistant", "content": f"❌ **Error in `{field}`:** {message}"})
-                st.session_state.messages.append({"role": "assistant", "content": "Type 'Back' to go to the last section with errors or 'Submit' again if you think it's correct after review."})
-
-        elif "back" in user_input.lower():
-            # This 'Back' logic is simplified for chatbot.
-            # In a real app, you'd need to track previous states more granularly.
-            st.session_state.conversation_state = "ask_hipaa_privacy_acknowledged" # Go back to the last form section
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please type 'Submit' to finalize or 'Back' to review."})
-
-    elif current_state == "offer_start_over":
-        if "start over" in user_input.lower():
-            st.session_state.clear()
-            st.session_state.messages = [] # Clear messages on start over
-            st.session_state.conversation_state = "initial_greeting"
-            ask_next_question()
-        else:
-            st.session_state.messages.append({"role": "assistant", "content": "Please type 'Start Over' or continue."})
+    # Chat input for user
+    if user_input := st.chat_input("Type your response here..."):
+        st.session_state.messages.append({"role": "user", "content": user_input})
+        with st.chat_message("user"):
+            st.markdown(user_input)
+        already_rendered = len(st.session_state.messages)
+        process_response(user_input)
+        # Render whatever the handler appended right away so the reply shows
+        # in this run instead of waiting for the next fragment rerun; later
+        # runs pick these messages up from the history loop above.
+        for message in st.session_state.messages[already_rendered:]:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
 
 
 def app():
@@ -863,29 +862,13 @@ def app():
     if 'conversation_state' not in st.session_state:
         st.session_state.conversation_state = "initial_greeting"
     if 'new_patient_info' not in st.session_state:
-        st.session_state.new_patient_info = {}
+        st.session_state.new_patient_info = copy.deepcopy(_EMPTY_SKELETON)
     if 'npp_agreed' not in st.session_state: # Still useful for internal state tracking
         st.session_state.npp_agreed = False
     if 'npp_content' not in st.session_state:
         st.session_state.npp_content = load_npp_content() # Load NPP content once
 
-    # Display chat messages from history on app rerun
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-
-    # If this is the first run or after a restart, ask the initial question
-    if not st.session_state.messages or st.session_state.messages[-1]["role"] == "user":
-        # Only ask the next question if the last message was from the user or it's the very first load
-        ask_next_question()
-
-    # Chat input for user
-    if user_input := st.chat_input("Type your response here..."):
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        with st.chat_message("user"):
-            st.markdown(user_input)
-        process_response(user_input)
-        # Streamlit automatically reruns on input, so no explicit rerun needed here.
+    _conversation()
 
 
 if __name__ == '__main__':
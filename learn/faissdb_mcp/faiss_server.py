@@ -1,14 +1,15 @@
-import os, faiss, json, logging
-from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
+import asyncio
+import functools
+import os, json, logging
 from fastmcp import FastMCP, Context
+from collections import OrderedDict, deque
 from contextlib import asynccontextmanager
+from pathlib import Path
 from dotenv import load_dotenv
-from mcp.server.sse import SseServerTransport
 
 # ------------------ Setup Logging ------------------
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "INFO"),
     format='[%(asctime)s] [%(levelname)s] %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
@@ -24,6 +25,98 @@ FAISS_INDEX_PATH = "faiss.index"
 DOCS_JSON_PATH = "semantic_chunks.json"
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 TOP_K = 5
+# Follow-up questions whose embedding is this close to a recent one in the
+# same session reuse that retrieval instead of searching again.
+SESSION_SIM_THRESHOLD = 0.92
+SESSION_HISTORY_SIZE = 8
+# Most recently active sessions to keep history for; older ones are evicted
+# so a long-running server does not accumulate dead sessions.
+MAX_SESSIONS = 64
+# Repeat questions over the same retrieved chunks skip the Gemini call; the
+# cache is keyed on (retrieved doc ids, normalized query) and LRU-bounded.
+RESPONSE_CACHE_SIZE = 256
+
+# Invariant part of the Gemini prompt, built once.
+_PROMPT_PREFIX = (
+    "You are a helpful assistant. Use the following context to answer the the "
+    "question. If the context does not contain enough information, state that "
+    "clearly and then try to answer based on your general knowledge.\n\n"
+    "Context:\n"
+)
+
+# ------------------ Process-wide singletons ------------------
+# The transformer weights are ~90MB and take seconds to load; caching the
+# loader means a lifespan restart (or several contexts in one process) reuses
+# the same model instead of loading another copy. The import sits inside the
+# loader so the torch/transformers stack is only paid for when RAG is used.
+@functools.lru_cache(maxsize=1)
+def _get_embedder():
+    from sentence_transformers import SentenceTransformer
+
+    # EMBEDDER_BACKEND=onnx serves MiniLM through ONNX Runtime (with its graph
+    # optimizations, and int8 weights if a quantized export is present) via
+    # sentence-transformers' native backend support; default stays on torch.
+    backend = os.getenv("EMBEDDER_BACKEND", "torch")
+    logger.debug("Loading SentenceTransformer model '%s' (backend=%s)", EMBEDDING_MODEL_NAME, backend)
+    return SentenceTransformer(EMBEDDING_MODEL_NAME, backend=backend)
+
+# ------------------ Embedding micro-batcher ------------------
+# Each rag_query call used to pay a full encode([one_text]) forward pass.
+# Queries that arrive within a short window are coalesced into one batched
+# encode so concurrent callers share the model's matmul width.
+_BATCH_WINDOW_S = 0.005
+_BATCH_SIZE = 32
+
+class _EmbedBatcher:
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.queue = asyncio.Queue()
+        self._worker = None
+
+    async def embed(self, text: str):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, fut))
+        return await fut
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + _BATCH_WINDOW_S
+            while len(batch) < _BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await asyncio.to_thread(
+                    self.embedder.encode,
+                    texts,
+                    batch_size=_BATCH_SIZE,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False,
+                )
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), embedding in zip(batch, embeddings):
+                if not fut.done():
+                    # Keep the (1, d) shape index.search expects.
+                    fut.set_result(embedding.reshape(1, -1))
 
 # ------------------ App State ------------------
 class RAGContext:
@@ -31,36 +124,75 @@ class RAGContext:
         self.index = None
         self.documents = None
         self.embedder = None
+        self.batcher = None
         self.gemini_model = None
+        # Per-session retrieval history: session id -> deque of
+        # (query_embedding, doc_ids, matched_docs), newest last. LRU-bounded
+        # at MAX_SESSIONS so abandoned sessions get evicted.
+        self.sessions = OrderedDict()
+        # LRU of (doc ids, normalized query) -> Gemini response text.
+        self.response_cache = OrderedDict()
 
     async def setup(self):
         logger.debug("Setting up RAG context...")
+        # faiss and the Gemini SDK are imported here, not at module top, so
+        # FastMCP startup and workers that never serve RAG skip their cost.
+        import faiss
+        import google.generativeai as genai
         try:
-            self.index = faiss.read_index(FAISS_INDEX_PATH)
-            logger.debug(f"Loaded FAISS index from {FAISS_INDEX_PATH}")
+            # Let FAISS use all cores for the scan; the embedder already
+            # saturates its own thread pool inside encode.
+            faiss.omp_set_num_threads(os.cpu_count())
+            # Memory-map the index so multiple server processes share the OS
+            # page cache instead of each heaping its own copy; not every index
+            # format supports mmap, so fall back to a plain read.
+            try:
+                self.index = faiss.read_index(
+                    FAISS_INDEX_PATH, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                logger.debug("mmap load unsupported for this index format; reading into memory.")
+                self.index = faiss.read_index(FAISS_INDEX_PATH)
+            logger.debug("Loaded FAISS index from %s", FAISS_INDEX_PATH)
+            # Queries are embedded with normalize_embeddings=True, which only
+            # amounts to cosine similarity over an inner-product index; flag a
+            # mismatched artifact instead of silently returning L2 rankings.
+            if getattr(self.index, "metric_type", None) != faiss.METRIC_INNER_PRODUCT:
+                logger.warning(
+                    "Index at %s is not METRIC_INNER_PRODUCT; cosine ranking "
+                    "assumes normalized embeddings over an inner-product index.",
+                    FAISS_INDEX_PATH,
+                )
 
-            with open(DOCS_JSON_PATH, 'r') as f:
-                chunk_dicts = json.load(f)
+            # One bulk read + parse; json.loads over bytes skips the text
+            # decode layer json.load would add on top of the file object.
+            chunk_dicts = json.loads(Path(DOCS_JSON_PATH).read_bytes())
             self.documents = [d["chunk"] for d in chunk_dicts]
-            logger.debug(f"Loaded {len(self.documents)} document chunks")
+            logger.debug("Loaded %d document chunks", len(self.documents))
 
-            self.embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-            logger.debug(f"Initialized SentenceTransformer with model '{EMBEDDING_MODEL_NAME}'")
+            self.embedder = _get_embedder()
+            self.batcher = _EmbedBatcher(self.embedder)
+            logger.debug("Initialized SentenceTransformer with model '%s'", EMBEDDING_MODEL_NAME)
 
             genai.configure(api_key=GEMINI_API_KEY)
             self.gemini_model = genai.GenerativeModel("gemini-1.5-flash")
             logger.debug("Initialized Gemini model")
 
         except Exception as e:
-            logger.exception(f"Failed to initialize RAG context: {e}")
+            logger.exception("Failed to initialize RAG context: %s", e)
             raise
 
     async def cleanup(self):
         logger.debug("Cleaning up RAG context...")
+        if self.batcher is not None:
+            self.batcher.stop()
         self.index = None
         self.documents = None
         self.embedder = None
+        self.batcher = None
         self.gemini_model = None
+        self.sessions = OrderedDict()
+        self.response_cache = OrderedDict()
 
 # ------------------ Lifespan Context Manager ------------------
 @asynccontextmanager
@@ -84,37 +216,82 @@ async def rag_query(ctx: Context, user_query: str) -> str:
         logger.error("RAG system not fully initialized.")
         return "RAG system not initialized. Please check server logs."
 
-    logger.info(f"[RAG Tool] Received query: '{user_query}'")
+    logger.info("[RAG Tool] Received query: '%s'", user_query)
 
     try:
         # --- Embed and Search ---
-        query_embedding = rag_context.embedder.encode([user_query], normalize_embeddings=True)
-        D, I = rag_context.index.search(query_embedding, TOP_K)
-        matched_docs = [rag_context.documents[i] for i in I[0] if i != -1]
-        logger.debug(f"[RAG Tool] Retrieved {len(matched_docs)} documents for query.")
+        query_embedding = await rag_context.batcher.embed(user_query)
+
+        session_id = getattr(ctx, "session_id", None) or id(ctx)
+        history = rag_context.sessions.setdefault(session_id, deque(maxlen=SESSION_HISTORY_SIZE))
+        rag_context.sessions.move_to_end(session_id)
+        if len(rag_context.sessions) > MAX_SESSIONS:
+            rag_context.sessions.popitem(last=False)
+
+        matched_docs = None
+        for prev_embedding, prev_ids, prev_docs in reversed(history):
+            # Embeddings are L2-normalized, so the dot product is cosine sim;
+            # .item() collapses the (1, 1) result (NumPy 2.x no longer lets
+            # float() do that implicitly).
+            if (query_embedding @ prev_embedding.T).item() > SESSION_SIM_THRESHOLD:
+                # Correctness gate: only trust the cached retrieval if a
+                # cheap top-1 search still lands inside it.
+                _, top1 = await asyncio.to_thread(rag_context.index.search, query_embedding, 1)
+                if top1[0][0] in prev_ids:
+                    doc_ids, matched_docs = prev_ids, prev_docs
+                    logger.debug("[RAG Tool] Reusing retrieval from session history.")
+                break
+
+        if matched_docs is None:
+            # index.search is a synchronous CPU call; running it in a worker
+            # thread keeps the event loop free for concurrent tool requests.
+            D, I = await asyncio.to_thread(rag_context.index.search, query_embedding, TOP_K)
+            doc_ids = [i for i in I[0] if i != -1]
+            matched_docs = [rag_context.documents[i] for i in doc_ids]
+            history.append((query_embedding, doc_ids, matched_docs))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[RAG Tool] Retrieved %d documents for query.", len(matched_docs))
 
         context = "\n\n".join(matched_docs) if matched_docs else ""
         if not matched_docs:
             logger.warning("[RAG Tool] No relevant documents found. Proceeding without context.")
 
-        prompt = f"""You are a helpful assistant. Use the following context to answer the the question. If the context does not contain enough information, state that clearly and then try to answer based on your general knowledge.
-
-Context:
-{context}
+        cache_key = (tuple(sorted(int(i) for i in doc_ids)), user_query.strip().lower())
+        cached = rag_context.response_cache.get(cache_key)
+        if cached is not None:
+            rag_context.response_cache.move_to_end(cache_key)
+            logger.info("[RAG Tool] Returning cached Gemini response.")
+            return cached
 
-Question: {user_query}
-Answer:"""
+        prompt = "".join((_PROMPT_PREFIX, context, "\n\nQuestion: ", user_query, "\nAnswer:"))
 
         response = await rag_context.gemini_model.generate_content_async(prompt)
         logger.info("[RAG Tool] Gemini response generated successfully.")
-        return response.text.strip()
+        answer = response.text.strip()
+
+        rag_context.response_cache[cache_key] = answer
+        if len(rag_context.response_cache) > RESPONSE_CACHE_SIZE:
+            rag_context.response_cache.popitem(last=False)
+        return answer
 
     except Exception as e:
-        logger.exception(f"[RAG Tool] Error during processing: {e}")
+        logger.exception("[RAG Tool] Error during processing: %s", e)
         return f"An error occurred while processing the query: {e}"
 
 # ------------------ Start MCP Server ------------------
 if __name__ == "__main__":
+    import sys
+
+    # uvloop is optional: use it for faster asyncio scheduling when installed
+    # (it does not support Windows).
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logger.info("Using uvloop event loop policy.")
+        except ImportError:
+            pass
+
     logger.info("Starting FastMCP RAG Server...")
     try:
         mcp.run(
@@ -122,7 +299,7 @@ if __name__ == "__main__":
             host="127.0.0.1",
             port=4200,
             path="/rag_query",
-            log_level="debug",
+            log_level=os.getenv("LOG_LEVEL", "INFO").lower(),
         )
     except Exception as e:
-        logger.exception(f"FastMCP server failed to start: {e}")
+        logger.exception("FastMCP server failed to start: %s", e)
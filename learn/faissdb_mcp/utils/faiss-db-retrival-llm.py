@@ -1,6 +1,10 @@
 import os
 import faiss
 import json
+import pickle
+import numpy as np
+import torch
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from mcp.server.fastmcp import FastMCP
@@ -19,51 +23,131 @@ if not GEMINI_API_KEY:
 
 FAISS_INDEX_PATH = "./faiss.index"
 DOCS_JSON_PATH = "./semantic_chunks.json"
+DOCS_PKL_PATH = "./documents.pkl"
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 TOP_K = 5
-
-# --- Load FAISS Index and Document Chunks ---
-print(" Loading FAISS index and document chunks...")
-index = faiss.read_index(FAISS_INDEX_PATH)
-
-with open(DOCS_JSON_PATH, "r", encoding="utf-8") as f:
-    chunk_dicts = json.load(f)  # List of { "chunk": "..." }
-
-# Extract just the text chunks
-documents = [chunk["chunk"] for chunk in chunk_dicts]
-
-# --- Load Embedding Model ---
-print(" Loading embedding model...")
-embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-# --- Get User Query ---
-query = input(" Enter your question: ")
-
-# --- Embed Query and Normalize for Cosine Similarity ---
-print(" Embedding and searching...")
-query_embedding = embedder.encode([query], normalize_embeddings=True)
-
-# --- Perform FAISS Search ---
-D, I = index.search(query_embedding, TOP_K)
-matched_docs = [documents[i] for i in I[0]]
-
-# --- Build Prompt for Gemini ---
-context = "\n\n".join(matched_docs)
-prompt = f"""You are a helpful assistant. Use the following context to answer the question.
-
-Context:
-{context}
-
-Question: {query}
-Answer:"""
-
-# --- Query Gemini ---
-print(" Querying Gemini...")
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.0-flash")
-response = model.generate_content(prompt)
-
-# --- Display Result ---
-print("\n--- Gemini Answer ---")
-print(response.text.strip())
-
+# Questions whose embedding nearly matches an earlier one reuse the cached
+# Gemini answer, skipping both the corpus search and the LLM call.
+CACHE_SIM_THRESHOLD = 0.9
+# Invariant instruction text for the Gemini prompt, built once; each query
+# just concatenates its context and question around it.
+_SYSTEM = ("You are a helpful assistant. Use the following context to answer the question.\n\n"
+           "Context:\n")
+
+
+@lru_cache(maxsize=1)
+def _boot():
+    """Load the index, chunks, embedder and Gemini client once per process."""
+    print(" Loading FAISS index and document chunks...")
+    # Memory-map the index so only the pages a search touches are read;
+    # formats that cannot be mapped fall back to the plain in-memory load.
+    try:
+        index = faiss.read_index(FAISS_INDEX_PATH, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(FAISS_INDEX_PATH)
+    # Widen the HNSW search beam for better recall at TOP_K; older flat-index
+    # artifacts simply have no hnsw attribute.
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = 64
+
+    # FAISS parallelizes flat scans over queries, so with one query at a time
+    # the extra OpenMP threads would sit idle while thrashing the shared
+    # cache; pin to a single thread for this script's one-query searches.
+    faiss.omp_set_num_threads(1)
+
+    # Only faiss-gpu builds expose StandardGpuResources; move the index onto
+    # the GPU when both the build and the index type allow it (HNSW is
+    # CPU-only, so a failed clone just keeps the CPU index).
+    if torch.cuda.is_available() and hasattr(faiss, "StandardGpuResources"):
+        try:
+            gpu_res = faiss.StandardGpuResources()
+            index = faiss.index_cpu_to_gpu(gpu_res, 0, index)
+            print(" FAISS index moved to GPU.")
+        except RuntimeError:
+            pass
+
+    # Prefer the flat pickle emitted at ingest time (one buffer, no
+    # per-chunk dicts); fall back to the JSON metadata for older artifacts.
+    if os.path.exists(DOCS_PKL_PATH):
+        with open(DOCS_PKL_PATH, "rb") as f:
+            documents = pickle.load(f)
+    else:
+        with open(DOCS_JSON_PATH, "r", encoding="utf-8") as f:
+            chunk_dicts = json.load(f)  # List of { "chunk": "..." }
+        # Extract just the text chunks
+        documents = [chunk["chunk"] for chunk in chunk_dicts]
+    # An object array lets the top-K gather run as one fancy-index operation
+    # instead of a Python-level loop over result ids.
+    documents = np.array(documents, dtype=object)
+
+    print(" Loading embedding model...")
+    # fp16 on GPU when one is present; full precision on CPU, or ONNX Runtime
+    # when EMBEDDER_BACKEND=onnx is set (picks up int8 exports automatically).
+    backend = os.getenv("EMBEDDER_BACKEND", "torch")
+    if backend == "torch" and torch.cuda.is_available():
+        embedder = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cuda",
+                                       model_kwargs={"torch_dtype": "float16"})
+    else:
+        embedder = SentenceTransformer(EMBEDDING_MODEL_NAME, backend=backend)
+
+    genai.configure(api_key=GEMINI_API_KEY)
+    gemini = genai.GenerativeModel("gemini-2.0-flash")
+
+    # Semantic response cache: embeddings of past queries plus their answers.
+    cache_index = faiss.IndexFlatIP(embedder.get_sentence_embedding_dimension())
+    cached_responses = []
+
+    return index, documents, embedder, gemini, cache_index, cached_responses
+
+
+@lru_cache(maxsize=4096)
+def _embed(query: str) -> bytes:
+    """Normalized query embedding as bytes, memoized per exact query string."""
+    # bytes are hashable and immutable, which keeps the cached value safe
+    # from accidental mutation; callers rebuild the array with frombuffer.
+    embedder = _boot()[2]
+    return embedder.encode([query], normalize_embeddings=True).astype(np.float32).tobytes()
+
+
+def answer(query: str) -> str:
+    index, documents, embedder, gemini, cache_index, cached_responses = _boot()
+
+    print(" Embedding and searching...")
+    # Exact repeats of a prompt skip the transformer entirely; the semantic
+    # cache below then covers near-duplicates.
+    query_embedding = np.frombuffer(_embed(query), dtype=np.float32).reshape(1, -1)
+
+    # --- Check Semantic Cache ---
+    if cache_index.ntotal:
+        D_c, I_c = cache_index.search(query_embedding, 1)
+        if D_c[0, 0] > CACHE_SIM_THRESHOLD:
+            print(" Semantic cache hit.")
+            return cached_responses[I_c[0, 0]]
+
+    # --- Perform FAISS Search ---
+    D, I = index.search(query_embedding, TOP_K)
+    matched_docs = documents[I[0]].tolist()
+
+    # --- Build Prompt for Gemini ---
+    context = "\n\n".join(matched_docs)
+    prompt = _SYSTEM + context + "\n\nQuestion: " + query + "\nAnswer:"
+
+    # --- Query Gemini ---
+    print(" Querying Gemini...")
+    response = gemini.generate_content(prompt)
+    result = response.text.strip()
+
+    # --- Store in Semantic Cache ---
+    cache_index.add(query_embedding)
+    cached_responses.append(result)
+    return result
+
+
+if __name__ == "__main__":
+    _boot()  # pay the cold start once, before the first question
+    while True:
+        query = input(" Enter your question (blank to exit): ")
+        if not query.strip():
+            break
+        print("\n--- Gemini Answer ---")
+        print(answer(query))